@@ -1,8 +1,20 @@
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
-import requests
+import httpx
 import os
-from openai import AzureOpenAI
+import orjson
+import asyncio
+import contextlib
+import functools
+import re
+import logging
+import logging.handlers
+import queue
+from openai import AsyncAzureOpenAI
+from cachetools import TTLCache
+import ijson
+import msal
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_exponential_jitter
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -20,8 +32,44 @@ CLIENT_ID = os.getenv("CLIENT_ID")
 CLIENT_SECRET = os.getenv("CLIENT_SECRET")
 D365_ENV_URL = os.getenv("D365_ENV_URL")
 
+# === Logging ===
+# Records are handed to a background thread so logging never blocks the event loop
+logger = logging.getLogger(__name__)
+logger.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+logger.propagate = False
+_log_queue = queue.SimpleQueue()
+_log_handler = logging.StreamHandler()
+_log_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+_log_listener = logging.handlers.QueueListener(_log_queue, _log_handler)
+logger.addHandler(logging.handlers.QueueHandler(_log_queue))
+
+# === Shared HTTP Client ===
+# Keeps TLS connections to D365 alive between requests
+http_client = httpx.AsyncClient(
+    timeout=60.0,
+    limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+    transport=httpx.AsyncHTTPTransport(retries=3),
+)
+
 # === FastAPI Setup ===
-app = FastAPI()
+@contextlib.asynccontextmanager
+async def lifespan(app: FastAPI):
+    _log_listener.start()
+    app.state.odata_batcher = asyncio.create_task(odata_batcher())
+    yield
+    # Stop batching and fail whatever is still waiting on a query
+    tasks = [app.state.odata_batcher, *_batch_tasks]
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    while not _odata_queue.empty():
+        _, future = _odata_queue.get_nowait()
+        future.cancel()
+    await http_client.aclose()
+    await client.close()
+    _log_listener.stop()
+
+app = FastAPI(lifespan=lifespan)
 
 # === Request and Response Models ===
 class McpRequest(BaseModel):
@@ -32,108 +80,531 @@ class McpResponse(BaseModel):
     message: str
     processedContext: str
 
+class McpBatchRequest(BaseModel):
+    name: str
+    contexts: list[str]
+
+class McpBatchResponse(BaseModel):
+    message: str
+    batchId: str
+    status: str
+    results: dict[str, str] | None = None
+    errors: dict[str, str] | None = None
+    truncated: list[str] | None = None
+
 # === Azure AD Token for D365 F&O ===
-def get_access_token() -> str:
-    token_url = f"https://login.microsoftonline.com/{TENANT_ID}/oauth2/token"
-    payload = {
-        'grant_type': 'client_credentials',
-        'client_id': CLIENT_ID,
-        'client_secret': CLIENT_SECRET,
-        'resource': D365_ENV_URL
-    }
+# MSAL serves the token from its in-memory cache until it nears expiry.
+# The app is built lazily because MSAL discovers the authority over the network.
+@functools.cache
+def _msal_app() -> msal.ConfidentialClientApplication:
+    return msal.ConfidentialClientApplication(
+        CLIENT_ID,
+        client_credential=CLIENT_SECRET,
+        authority=f"https://login.microsoftonline.com/{TENANT_ID}",
+        token_cache=msal.SerializableTokenCache(),
+    )
 
-    response = requests.post(token_url, data=payload)
-    if response.status_code == 200:
-        return response.json().get('access_token')
+def _acquire_token() -> dict:
+    return _msal_app().acquire_token_for_client(scopes=[f"{D365_ENV_URL}/.default"])
+
+async def get_access_token() -> str:
+    # MSAL is synchronous, so keep it off the event loop
+    result = await asyncio.to_thread(_acquire_token)
+    if "access_token" in result:
+        return result["access_token"]
     else:
-        raise Exception(f"Token request failed: {response.status_code} - {response.text}")
+        raise Exception(f"Token request failed: {result.get('error')} - {result.get('error_description')}")
 
 # === Azure OpenAI Client ===
-client = AzureOpenAI(
+OPENAI_TIMEOUT = 30.0
+OPENAI_MAX_RETRIES = 2
+client = AsyncAzureOpenAI(
     api_version=api_version,
     azure_endpoint=endpoint,
     api_key=subscription_key,
+    # Fail fast on a slow region instead of holding sockets for minutes
+    timeout=httpx.Timeout(OPENAI_TIMEOUT, connect=5.0),
+    max_retries=OPENAI_MAX_RETRIES,
 )
 
+# Caps in-flight chat completions so bursts queue here instead of tripping 429s
+OAI_SEM = asyncio.Semaphore(10)
+
+# === Rule-based OData Queries ===
+# Intents that fully match one of these patterns never reach the LLM
+DEFAULT_TOP = 10
+MAX_RULE_INTENT_LENGTH = 200
+_TOP_CUSTOMERS_RE = re.compile(
+    r"^get\s+(?:the\s+)?(?:(?:top|first)\s+(\d+)\s+)?customers(?:\s+top\s+(\d+))?$", re.IGNORECASE)
+_CUSTOMERS_IN_RE = re.compile(r"^get\s+customers\s+(?:in|from)\s+([a-z]{3})$", re.IGNORECASE)
+# ISO 3166-1 alpha-3 codes, the form D365 uses for AddressCountryRegionId
+_COUNTRY_REGION_IDS = frozenset("""
+    ABW AFG AGO AIA ALA ALB AND ARE ARG ARM ASM ATA ATF ATG AUS AUT AZE BDI BEL BEN BES BFA BGD BGR BHR BHS
+    BIH BLM BLR BLZ BMU BOL BRA BRB BRN BTN BVT BWA CAF CAN CCK CHE CHL CHN CIV CMR COD COG COK COL COM CPV
+    CRI CUB CUW CXR CYM CYP CZE DEU DJI DMA DNK DOM DZA ECU EGY ERI ESH ESP EST ETH FIN FJI FLK FRA FRO FSM
+    GAB GBR GEO GGY GHA GIB GIN GLP GMB GNB GNQ GRC GRD GRL GTM GUF GUM GUY HKG HMD HND HRV HTI HUN IDN IMN
+    IND IOT IRL IRN IRQ ISL ISR ITA JAM JEY JOR JPN KAZ KEN KGZ KHM KIR KNA KOR KWT LAO LBN LBR LBY LCA LIE
+    LKA LSO LTU LUX LVA MAC MAF MAR MCO MDA MDG MDV MEX MHL MKD MLI MLT MMR MNE MNG MNP MOZ MRT MSR MTQ MUS
+    MWI MYS MYT NAM NCL NER NFK NGA NIC NIU NLD NOR NPL NRU NZL OMN PAK PAN PCN PER PHL PLW PNG POL PRI PRK
+    PRT PRY PSE PYF QAT REU ROU RUS RWA SAU SDN SEN SGP SGS SHN SJM SLB SLE SLV SMR SOM SPM SRB SSD STP SUR
+    SVK SVN SWE SWZ SXM SYC SYR TCA TCD TGO THA TJK TKL TKM TLS TON TTO TUN TUR TUV TWN TZA UGA UKR UMI URY
+    USA UZB VAT VCT VEN VGB VIR VNM VUT WLF WSM YEM ZAF ZMB ZWE
+""".split())
+_CUSTOMER_ID_RE = re.compile(
+    r"^get\s+customers?\s+with\s+(?:id|account)\s+([\w-]+)$", re.IGNORECASE)
+
+def generate_odata_query(intent: str) -> str | None:
+    # Every rule is a short "get ..." sentence; skip the normalisation otherwise
+    if len(intent) > MAX_RULE_INTENT_LENGTH or intent.lstrip()[:3].lower() != "get":
+        return None
+    intent = " ".join(intent.split())
+
+    match = _TOP_CUSTOMERS_RE.match(intent)
+    if match:
+        top = match.group(1) or match.group(2) or DEFAULT_TOP
+        return f"CustomersV3?$top={top}"
+
+    # Anything that is not a known region code ("in all", "in the") is left to the LLM
+    match = _CUSTOMERS_IN_RE.match(intent)
+    if match and match.group(1).upper() in _COUNTRY_REGION_IDS:
+        return f"CustomersV3?$filter=AddressCountryRegionId eq '{match.group(1).upper()}'"
+
+    match = _CUSTOMER_ID_RE.match(intent)
+    if match:
+        return f"CustomersV3?$filter=CustomerAccount eq '{match.group(1)}'"
+
+    return None
+
 # === Query Azure OpenAI for OData ===
-def query_llm_for_odata(intent: str) -> str:
-    response = client.chat.completions.create(
+# Requests arriving within BATCH_WINDOW_MS share a single chat completion
+BATCH_WINDOW_MS = int(os.getenv("BATCH_WINDOW_MS", "20"))
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "8"))
+ODATA_MAX_TOKENS = 64
+CHANGES_MAX_TOKENS = 1024
+_BATCH_LINE_RE = re.compile(r"^\s*(\d+)\s*[:.)]\s*(\S.*)$")
+# System prompts are built once; the OpenAI SDK does not mutate messages
+_ODATA_SYSTEM_MSG = {
+    "role": "system", "content": "You generate valid OData query paths for Dynamics 365 Finance & Operations."
+    "Return just the relative URL path after /data/ with no explanation or markdown."
+    #"Example:CustTransactions$top=10&CurrencyCode ne 'USD'"
+    "Example: CustomersV3?$top=10 "
+    #"After you execute the OData query, you will return customer names and IDs. Return response as as it is from Odata in XML format"
+}
+_ODATA_BATCH_SYSTEM_MSG = {
+    "role": "system", "content": "You generate valid OData query paths for Dynamics 365 Finance & Operations."
+    "You receive several numbered requests, one per line. Answer each on its own line as <number>: <path>, "
+    "where <path> is just the relative URL path after /data/ with no explanation or markdown."
+    "Example: 1: CustomersV3?$top=10 "
+}
+_CHANGES_SYSTEM_MSG = {
+    "role": "system", "content": "Return only customer names and CustomerAccount. return original OData response as it is in XML format."
+    "Return with no explanation or markdown."
+}
+
+_odata_queue: asyncio.Queue = asyncio.Queue()
+_batch_tasks = set()
+
+async def resolve_odata_query(intent: str) -> str:
+    return generate_odata_query(intent) or await query_llm_for_odata(intent)
+
+async def query_llm_for_odata(intent: str) -> str:
+    batcher = getattr(app.state, "odata_batcher", None)
+    if batcher is None or batcher.done():
+        raise Exception("OData query batcher is not running")
+
+    future = asyncio.get_running_loop().create_future()
+    await _odata_queue.put((intent, future))
+    try:
+        # Covers the batch window plus every attempt the OpenAI client may make
+        return await asyncio.wait_for(future, timeout=OPENAI_TIMEOUT * (OPENAI_MAX_RETRIES + 1))
+    except asyncio.TimeoutError:
+        raise Exception("Timed out waiting for OData query generation")
+
+async def _generate_odata_query(intent: str) -> str:
+    response = await client.chat.completions.create(
         model=deployment,  # This refers to your Azure deployment name
-        messages=[
-            {"role": "system", "content": "You generate valid OData query paths for Dynamics 365 Finance & Operations."
-             "Return just the relative URL path after /data/ with no explanation or markdown."
-             #"Example:CustTransactions$top=10&CurrencyCode ne 'USD'"
-             "Example: CustomersV3?$top=10 "
-             #"After you execute the OData query, you will return customer names and IDs. Return response as as it is from Odata in XML format"             
-             },
-            {"role": "user", "content": intent}
-        ],
-        temperature=0.2
+        messages=[_ODATA_SYSTEM_MSG, {"role": "user", "content": intent}],
+        temperature=0.2,
+        # OData paths are a single short line
+        max_tokens=ODATA_MAX_TOKENS,
+        stop=["\n", "```"]
     )
-    return response.choices[0].message.content.strip()
+    # A completion that opens with a fence or newline is cut to nothing by the stop list
+    query = (response.choices[0].message.content or "").strip()
+    if not query:
+        raise Exception("No OData query generated")
+    return query
 
-# === Query Azure OpenAI for OData ===
-def query_llm_for_changes(intent: str) -> str:
-    response = client.chat.completions.create(
+async def _generate_odata_queries(intents: list[str]) -> dict[int, str]:
+    # Each intent must stay on its own numbered line, or one caller's text
+    # could answer for another request in the same batch
+    numbered = "\n".join(f"{i}: {' '.join(intent.split())}" for i, intent in enumerate(intents, 1))
+    response = await client.chat.completions.create(
         model=deployment,  # This refers to your Azure deployment name
-        messages=[
-            {
-                "role": "system", "content": "Return only customer names and CustomerAccount. return original OData response as it is in XML format."
-                "Return with no explanation or markdown."             
-             },
-            {"role": "user", "content": intent}
-        ],
-        temperature=0.2
+        messages=[_ODATA_BATCH_SYSTEM_MSG, {"role": "user", "content": numbered}],
+        temperature=0.2,
+        max_tokens=ODATA_MAX_TOKENS * len(intents),
+        stop=["```"]
+    )
+    return _parse_batch_queries(response.choices[0].message.content or "")
+
+def _parse_batch_queries(content: str) -> dict[int, str]:
+    queries = {}
+    duplicates = set()
+    for line in content.splitlines():
+        match = _BATCH_LINE_RE.match(line)
+        if not match:
+            continue
+        i = int(match.group(1)) - 1
+        query = match.group(2).strip()
+        if not query:
+            continue
+        if i in queries:
+            duplicates.add(i)
+        else:
+            queries[i] = query
+    # An ambiguous answer is treated as missing so its request fails
+    for i in duplicates:
+        del queries[i]
+    return queries
+
+async def _resolve_odata_batch(batch: list) -> None:
+    try:
+        async with OAI_SEM:
+            if len(batch) == 1:
+                queries = {0: await _generate_odata_query(batch[0][0])}
+            else:
+                queries = await _generate_odata_queries([intent for intent, _ in batch])
+    except asyncio.CancelledError:
+        _cancel_futures(batch)
+        raise
+    except Exception as e:
+        for _, future in batch:
+            if not future.done():
+                future.set_exception(e)
+        return
+
+    for i, (_, future) in enumerate(batch):
+        if future.done():
+            continue
+        if i in queries:
+            future.set_result(queries[i])
+        else:
+            future.set_exception(Exception(f"No OData query generated for batched request {i + 1}"))
+
+def _cancel_futures(batch: list) -> None:
+    for _, future in batch:
+        future.cancel()
+
+async def odata_batcher():
+    loop = asyncio.get_running_loop()
+    while True:
+        batch = [await _odata_queue.get()]
+        deadline = loop.time() + BATCH_WINDOW_MS / 1000
+        try:
+            while len(batch) < BATCH_MAX_SIZE:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(_odata_queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+        except asyncio.CancelledError:
+            _cancel_futures(batch)
+            raise
+
+        # Keep collecting the next batch while this one is in flight
+        task = asyncio.create_task(_resolve_odata_batch(batch))
+        _batch_tasks.add(task)
+        task.add_done_callback(_batch_tasks.discard)
+
+# === Azure OpenAI Batch API ===
+# Bulk callers trade latency (up to 24h) for half-price completions.
+# Each context is resolved against D365 first, so the model only reformats real rows.
+async def submit_batch(contexts: list[str]):
+    queries, token = await asyncio.gather(
+        asyncio.gather(*(resolve_odata_query(context) for context in contexts)),
+        get_access_token(),
+    )
+    # Only the (id, name) pairs are sent, keeping each line well inside the context window
+    results = await asyncio.gather(*(call_odata(query, token, customer_fields) for query in queries))
+    for i, result in enumerate(results):
+        if "error" in result:
+            raise Exception(f"OData request failed for context {i + 1}: {result['error']}")
+
+    lines = [
+        orjson.dumps({
+            "custom_id": f"request-{i}",
+            "method": "POST",
+            "url": "/chat/completions",
+            "body": {
+                "model": deployment,
+                "messages": [
+                    _CHANGES_SYSTEM_MSG,
+                    {"role": "user", "content": process_odata_response(result)}
+                ],
+                "temperature": 0.2,
+                "max_tokens": CHANGES_MAX_TOKENS
+            }
+        })
+        for i, result in enumerate(results)
+    ]
+    batch_file = await client.files.create(
+        file=("batch.jsonl", b"\n".join(lines)),
+        purpose="batch"
+    )
+    return await client.batches.create(
+        input_file_id=batch_file.id,
+        endpoint="/chat/completions",
+        completion_window="24h"
     )
-    return response.choices[0].message.content.strip()
+
+# Batches in these states may carry output and error files
+BATCH_FINAL_STATUSES = {"completed", "expired", "cancelled"}
+
+async def fetch_batch_results(output_file_id: str | None, error_file_id: str | None) -> tuple:
+    # Rejected requests are written to the error file, not the output file
+    results, errors, truncated = {}, {}, []
+    for file_id in (output_file_id, error_file_id):
+        if not file_id:
+            continue
+        content = await client.files.content(file_id)
+        for line in content.content.splitlines():
+            if not line.strip():
+                continue
+            item = orjson.loads(line)
+            custom_id = item["custom_id"]
+            response = item.get("response") or {}
+            body = response.get("body") or {}
+            if body.get("choices"):
+                choice = body["choices"][0]
+                results[custom_id] = (choice["message"].get("content") or "").strip()
+                if choice.get("finish_reason") == "length":
+                    truncated.append(custom_id)
+            else:
+                errors[custom_id] = str(
+                    item.get("error") or body.get("error") or f"HTTP {response.get('status_code')}")
+    return results, errors, truncated
 
 # === Call D365 F&O OData Endpoint ===
-def call_odata(query_path: str) -> dict:
+# Successful responses are reused per query path for ODATA_CACHE_TTL seconds.
+# The cache is only touched from the event loop thread, so it needs no lock.
+ODATA_CACHE_TTL = float(os.getenv("ODATA_CACHE_TTL", "60"))
+_odata_cache = TTLCache(maxsize=512, ttl=ODATA_CACHE_TTL)
+_odata_inflight = {}
+
+# Throttled or transiently failing requests are retried with jittered backoff
+ODATA_SEM = asyncio.Semaphore(20)
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+class _AsyncByteReader:
+    # Minimal async file object over an httpx response for ijson
+    def __init__(self, response: httpx.Response):
+        self._chunks = response.aiter_bytes()
+
+    async def read(self, size: int = -1) -> bytes:
+        # ijson probes with read(0) to detect bytes vs str
+        if size == 0:
+            return b""
+        return await anext(self._chunks, b"")
+
+async def call_odata(query_path: str, token: str, extractor=None) -> dict:
+    # extractor builds a per-response row projection; only projected rows are kept
+    cache_key = (query_path, extractor)
+    cached = _odata_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    # Concurrent misses for the same key share a single D365 round-trip
+    inflight = _odata_inflight.get(cache_key)
+    if inflight is not None:
+        return await asyncio.shield(inflight)
+
+    future = asyncio.get_running_loop().create_future()
+    # Mark the outcome as retrieved even when nobody else was waiting
+    future.add_done_callback(lambda f: f.cancelled() or f.exception())
+    _odata_inflight[cache_key] = future
+    try:
+        results = await _load_odata(query_path, token, extractor, cache_key)
+    except BaseException as e:
+        future.set_exception(Exception(f"OData request failed: {e!r}"))
+        raise
+    else:
+        future.set_result(results)
+        return results
+    finally:
+        del _odata_inflight[cache_key]
+
+async def _load_odata(query_path: str, token: str, extractor, cache_key: tuple) -> dict:
     base_url = f"{D365_ENV_URL}/data"
     full_url = f"{base_url}/{query_path}"
 
     headers = {
-        "Authorization": f"Bearer {get_access_token()}",
+        "Authorization": f"Bearer {token}",
         "Accept": "application/json"
     }
-    print(f"Calling OData endpoint: {full_url}")
-    response = requests.get(full_url, headers=headers)
-    # Print raw response text (HTML or JSON)
-    #print("=== RAW ODATA RESPONSE ===")
-   # print(response.text)
-   # print("==========================")
-    return response.json() if response.status_code == 200 else {"error": response.text}
+    logger.info("Calling OData endpoint: %s", full_url)
+    try:
+        results = await _fetch_odata(full_url, headers, extractor, _is_key_lookup(query_path))
+    except httpx.HTTPStatusError as e:
+        return {"error": e.response.text}
+
+    # Empty results are not cached, so a lookup that found nothing is retried
+    if "error" not in results and results["value"]:
+        _odata_cache[cache_key] = results
+    return results
+
+@retry(
+    retry=retry_if_exception_type(httpx.HTTPStatusError),
+    wait=wait_exponential_jitter(initial=0.5, max=8),
+    stop=stop_after_attempt(3),
+    reraise=True,
+)
+async def _fetch_odata(full_url: str, headers: dict, extractor=None, single_entity: bool = False) -> dict:
+    async with ODATA_SEM:
+        async with http_client.stream("GET", full_url, headers=headers) as response:
+            if response.status_code != 200:
+                await response.aread()
+                if response.status_code in RETRYABLE_STATUS:
+                    response.raise_for_status()
+                return {"error": response.text}
+            project = extractor() if extractor else None
+            if single_entity:
+                # A single entity is small, so buffer it and decode in one go
+                await response.aread()
+                return _parse_odata_entity(response.content, project)
+            try:
+                return await _parse_odata(_AsyncByteReader(response), project)
+            except ijson.JSONError as e:
+                return {"error": f"Invalid OData response: {e}"}
+
+def _is_key_lookup(query_path: str) -> bool:
+    # Key lookups such as CustomersV3(dataAreaId='usmf',CustomerAccount='US-001')
+    # return one entity instead of a value[] collection
+    return query_path.split("?", 1)[0].rstrip("/").endswith(")")
+
+async def _parse_odata(reader: _AsyncByteReader, project=None) -> dict:
+    # Rows are parsed one at a time as they arrive instead of buffering the whole payload
+    rows = ijson.items(reader, "value.item", use_float=True)
+    if project:
+        return {"value": [project(row) async for row in rows]}
+    return {"value": [row async for row in rows]}
+
+def _parse_odata_entity(body: bytes, project=None) -> dict:
+    try:
+        entity = orjson.loads(body)
+    except orjson.JSONDecodeError as e:
+        return {"error": f"Invalid OData response: {e}"}
+    if not isinstance(entity, dict):
+        return {"error": f"Unexpected OData response: {entity!r}"}
+    return {"value": [project(entity) if project else entity]}
+
+# === Process OData Response ===
+# Field names tried in order when picking a customer's ID and name
+ID_KEYS = ("CustomerAccount", "CustomerAccountNumber", "AccountNum", "CustomerId", "Id")
+NAME_KEYS = ("OrganizationName", "Name", "CustomerName", "NameAlias", "PersonFullName")
+
+def customer_fields():
+    # Rows of one response share a schema, so resolve the field names on the
+    # first row and reduce every row to (id, name) while it is streamed
+    keys = None
+
+    def project(row: dict) -> tuple:
+        nonlocal keys
+        if keys is None:
+            keys = (
+                next((k for k in ID_KEYS if k in row), None),
+                next((k for k in NAME_KEYS if k in row), None),
+            )
+        return row.get(keys[0], 'unknown'), row.get(keys[1], 'unknown')
+
+    return project
+
+def process_odata_response(results: dict) -> str:
+    # Expects rows projected by customer_fields
+    if "error" in results:
+        return f"Error: {results['error']}"
+    rows = results.get("value") or []
+    if not rows:
+        return "No customers found."
+
+    return "\n".join([f"{customer_id}: {name}" for customer_id, name in rows])
 
 # === MCP Endpoint ===
+# Larger contexts are rejected rather than copied by upper()
+MAX_CONTEXT_LENGTH = 1_000_000
+
 @app.post("/api/mcp", response_model=McpResponse)
-def process_mcp(request: McpRequest):
+async def process_mcp(request: McpRequest):
     if not request.name or not request.context:
         raise HTTPException(status_code=400, detail="Name and Context are required.")
+    if len(request.context) > MAX_CONTEXT_LENGTH:
+        raise HTTPException(status_code=413, detail="Context is too large.")
+
+    # Rule-matched intents such as "get customer with id X" are lookups too
+    rule_query = generate_odata_query(request.context)
+    if rule_query is None and "get customers" not in request.context.lower():
+        return McpResponse(
+            message=f"Hello {request.name}, your context was processed.",
+            processedContext=request.context.upper()
+        )
 
     try:
-        if "get customers" in request.context.lower():
-            query = query_llm_for_odata(request.context)
-            print(f"Generated OData query: {query}")
-            results = call_odata(query)
-            print("=== ODATA RESPONSE ===")
-            print(results)
-            print("==========================")
-            print("Now Processing the OData response to get customer names and IDs")
-            results = query_llm_for_changes(str(results))
-            print("=== Data changes after OData ===")
-            print(results)
-            print("==========================")
-            
-
-            return McpResponse(
-                message=f"Hello {request.name}, here are your custmers:",
-                processedContext=str(results)
-            )
-        
+        if rule_query:
+            query, token = rule_query, await get_access_token()
         else:
-            return McpResponse(
-                message=f"Hello {request.name}, your context was processed.",
-                processedContext=request.context.upper()
+            # The token does not depend on the query, so fetch both at once
+            query, token = await asyncio.gather(
+                query_llm_for_odata(request.context),
+                get_access_token(),
             )
+        logger.info("Generated OData query: %s", query)
+        results = await call_odata(query, token, customer_fields)
+        logger.debug("OData response: %s", results)
+        logger.info("Processing the OData response to get customer names and IDs")
+        results = process_odata_response(results)
+        logger.debug("Data changes after OData: %s", results)
+
+        return McpResponse(
+            message=f"Hello {request.name}, here are your custmers:",
+            processedContext=str(results)
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# === MCP Batch Endpoints ===
+@app.post("/api/mcp/batch", response_model=McpBatchResponse)
+async def submit_mcp_batch(request: McpBatchRequest):
+    if not request.name or not request.contexts:
+        raise HTTPException(status_code=400, detail="Name and Contexts are required.")
+
+    try:
+        batch = await submit_batch(request.contexts)
+        return McpBatchResponse(
+            message=f"Hello {request.name}, your batch was submitted.",
+            batchId=batch.id,
+            status=batch.status
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/mcp/batch/{batch_id}", response_model=McpBatchResponse)
+async def get_mcp_batch(batch_id: str):
+    try:
+        batch = await client.batches.retrieve(batch_id)
+        if batch.status not in BATCH_FINAL_STATUSES:
+            return McpBatchResponse(message=f"Batch {batch.status}.", batchId=batch.id, status=batch.status)
+
+        results, errors, truncated = await fetch_batch_results(batch.output_file_id, batch.error_file_id)
+        return McpBatchResponse(
+            message=f"Batch {batch.status}: {len(results)} succeeded, {len(errors)} failed, "
+                    f"{len(truncated)} truncated.",
+            batchId=batch.id,
+            status=batch.status,
+            results=results,
+            errors=errors,
+            truncated=truncated
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
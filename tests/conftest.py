@@ -0,0 +1,11 @@
+import os
+import sys
+
+# main.py builds its clients at import time, so give them dummy settings
+os.environ.setdefault("AZURE_OPENAI_KEY", "test-key")
+os.environ.setdefault("AZURE_OPENAI_ENDPOINT", "https://example.openai.azure.com")
+os.environ.setdefault("AZURE_OPENAI_API_VERSION", "2024-10-21")
+os.environ.setdefault("AZURE_OPENAI_DEPLOYMENT", "test-deployment")
+os.environ.setdefault("D365_ENV_URL", "https://d365.example.com")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,119 @@
+import asyncio
+
+import pytest
+
+import main
+
+
+class ChunkReader:
+    # Async file object handing out a payload in small chunks, like _AsyncByteReader
+    def __init__(self, payload: bytes, size: int = 7):
+        self._chunks = iter([payload[i:i + size] for i in range(0, len(payload), size)])
+
+    async def read(self, size: int = -1) -> bytes:
+        if size == 0:
+            return b""
+        return next(self._chunks, b"")
+
+
+# === generate_odata_query ===
+@pytest.mark.parametrize("intent, expected", [
+    ("get customers", "CustomersV3?$top=10"),
+    ("Get top 5 customers", "CustomersV3?$top=5"),
+    ("get the first 20 customers", "CustomersV3?$top=20"),
+    ("get customers top 3", "CustomersV3?$top=3"),
+    ("  get   customers  ", "CustomersV3?$top=10"),
+])
+def test_top_customers(intent, expected):
+    assert main.generate_odata_query(intent) == expected
+
+
+@pytest.mark.parametrize("intent, expected", [
+    ("get customers in usa", "CustomersV3?$filter=AddressCountryRegionId eq 'USA'"),
+    ("get customers from DEU", "CustomersV3?$filter=AddressCountryRegionId eq 'DEU'"),
+    ("get customers in all", None),
+    ("get customers in the", None),
+    ("get customers in us", None),
+    ("get customers from Germany", None),
+])
+def test_customers_in_region(intent, expected):
+    assert main.generate_odata_query(intent) == expected
+
+
+@pytest.mark.parametrize("intent, expected", [
+    ("get customer with id US-001", "CustomersV3?$filter=CustomerAccount eq 'US-001'"),
+    ("get customers with account DE-01", "CustomersV3?$filter=CustomerAccount eq 'DE-01'"),
+    ("get customer with id O'Brien", None),
+])
+def test_customer_by_id(intent, expected):
+    assert main.generate_odata_query(intent) == expected
+
+
+@pytest.mark.parametrize("intent", [
+    "get customers who owe money",
+    "hello there",
+    "get customers " + "x" * main.MAX_RULE_INTENT_LENGTH,
+])
+def test_unmatched_intents_fall_through(intent):
+    assert main.generate_odata_query(intent) is None
+
+
+# === _parse_batch_queries ===
+def test_batch_answers_are_numbered_from_one():
+    assert main._parse_batch_queries("1: CustomersV3?$top=5\n2. VendorsV2\n3) Sales") == {
+        0: "CustomersV3?$top=5", 1: "VendorsV2", 2: "Sales"}
+
+
+def test_batch_answers_skip_blank_and_unnumbered_lines():
+    assert main._parse_batch_queries("Here you go:\n1: CustomersV3\n2:   \n\n") == {0: "CustomersV3"}
+
+
+def test_batch_duplicate_answers_are_dropped():
+    assert main._parse_batch_queries("1: A\n2: Good\n2: Evil\n3: C") == {0: "A", 2: "C"}
+
+
+# === OData parsing ===
+def test_parse_collection_streams_rows():
+    payload = b'{"@odata.context":"c","value":[{"CustomerAccount":"A","X":1.5},{"CustomerAccount":"B"}]}'
+    results = asyncio.run(main._parse_odata(ChunkReader(payload)))
+    assert results == {"value": [{"CustomerAccount": "A", "X": 1.5}, {"CustomerAccount": "B"}]}
+
+
+def test_parse_collection_applies_projection():
+    payload = b'{"value":[{"CustomerAccount":"A","OrganizationName":"Alpha"},{"CustomerAccount":"B"}]}'
+    results = asyncio.run(main._parse_odata(ChunkReader(payload), main.customer_fields()))
+    assert results == {"value": [("A", "Alpha"), ("B", "unknown")]}
+
+
+def test_parse_empty_collection():
+    assert asyncio.run(main._parse_odata(ChunkReader(b'{"value":[]}'))) == {"value": []}
+
+
+def test_parse_single_entity():
+    body = b'{"@odata.context":"c","CustomerAccount":"US-001","OrganizationName":"Contoso"}'
+    assert main._parse_odata_entity(body, main.customer_fields()) == {"value": [("US-001", "Contoso")]}
+
+
+def test_parse_single_entity_rejects_non_objects():
+    assert "error" in main._parse_odata_entity(b"42")
+    assert "error" in main._parse_odata_entity(b"not json")
+
+
+@pytest.mark.parametrize("query_path, expected", [
+    ("CustomersV3(dataAreaId='usmf',CustomerAccount='US-001')", True),
+    ("CustomersV3(dataAreaId='usmf',CustomerAccount='US-001')?$select=OrganizationName", True),
+    ("CustomersV3?$top=10", False),
+    ("CustomersV3?$filter=CustomerAccount eq 'US-001'", False),
+])
+def test_key_lookup_detection(query_path, expected):
+    assert main._is_key_lookup(query_path) is expected
+
+
+# === process_odata_response ===
+def test_process_odata_response_formats_pairs():
+    assert main.process_odata_response({"value": [("A", "Alpha"), ("B", "Beta")]}) == "A: Alpha\nB: Beta"
+
+
+def test_process_odata_response_empty_and_error():
+    assert main.process_odata_response({"value": []}) == "No customers found."
+    assert main.process_odata_response({"error": "boom"}) == "Error: boom"